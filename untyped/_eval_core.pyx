@@ -0,0 +1,62 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+
+from untyped.debruijn import DBApp
+from untyped.vm import _quote
+
+cdef enum:
+  OP_VAR = 0
+  OP_FREE = 1
+  OP_LAM = 2
+  OP_APP = 3
+  OP_RET = 4
+
+
+def run(chunk):
+  cdef const int[:] code = chunk.code
+  cdef list entries = chunk.entries
+  cdef list frees = chunk.frees
+  cdef list applies = chunk.applies
+  cdef list stack = []
+  cdef list frames = []
+  cdef tuple closure, frame
+  cdef object env = None
+  cdef object func, applicant, e
+  cdef Py_ssize_t pc = 0
+  cdef int op, i
+
+  while True:
+    op = code[pc]
+
+    if op == OP_APP:
+      applicant = stack.pop()
+      func = stack.pop()
+
+      if type(func) is tuple:
+        closure = <tuple>func
+        if code[pc + 2] != OP_RET:
+          frames.append((pc + 2, env))
+        pc = <Py_ssize_t>entries[<Py_ssize_t>closure[0]]
+        env = (applicant, closure[1])
+        continue
+
+      stack.append(DBApp(func, _quote(chunk, applicant, {}), applies[code[pc + 1]]))
+    elif op == OP_VAR:
+      e = env
+      for i in range(code[pc + 1]):
+        e = (<tuple>e)[1]
+      stack.append((<tuple>e)[0])
+    elif op == OP_LAM:
+      stack.append((code[pc + 1], env))
+    elif op == OP_FREE:
+      stack.append(frees[code[pc + 1]])
+    elif op == OP_RET:
+      if not frames:
+        break
+      frame = <tuple>frames.pop()
+      pc = <Py_ssize_t>frame[0]
+      env = frame[1]
+      continue
+
+    pc += 2
+
+  return _quote(chunk, stack.pop(), {})
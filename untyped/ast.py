@@ -1,12 +1,51 @@
-from typing import TypeAlias
+import sys
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from typing import ClassVar, TypeAlias
 
 
+def line_starts(code: str) -> list[int]:
+  starts = [0]
+  i = code.find('\n')
+  while i != -1:
+    starts.append(i + 1)
+    i = code.find('\n', i + 1)
+  return starts
+
+
+def line_col(starts: list[int], offset: int) -> tuple[int, int]:
+  line = bisect_right(starts, offset)
+  return line, offset - starts[line - 1] + 1
+
+
+@dataclass(slots=True, frozen=True, eq=False)
+class Source:
+
+  name: str
+  line_starts: list[int]
+
+  @classmethod
+  def of(cls, name: str, code: str) -> 'Source':
+    return cls(name, line_starts(code))
+
+  def line_col(self, offset: int) -> tuple[int, int]:
+    return line_col(self.line_starts, offset)
+
+
+@dataclass(slots=True, frozen=True, eq=False, repr=False, weakref_slot=True)
 class ASTNode:
 
-  def __init__(self, file: str, line: int, col: int):
-    self.file = file
-    self.line = line
-    self.col = col
+  TAG: ClassVar[int]
+
+  source: Source
+  offset: int
+
+  @property
+  def file(self) -> str:
+    return self.source.name
+
+  def line_col(self) -> tuple[int, int]:
+    return self.source.line_col(self.offset)
 
   def __repr__(self):
     return str(self)
@@ -15,111 +54,308 @@ class ASTNode:
 Expression: TypeAlias = 'Identifier | Apply | Lambda | Parentheses'
 
 
+@dataclass(slots=True, frozen=True, eq=False, repr=False)
 class Identifier(ASTNode):
 
-  __match_args__ = ('file', 'line', 'col', 'name')
+  TAG = 0
+
+  name: str
+  _hash: int = field(init=False)
 
-  def __init__(self, file: str, line: int, col: int, name: str):
-    super().__init__(file, line, col)
-    self.name = name
+  def __post_init__(self):
+    object.__setattr__(self, '_hash', hash(self.name))
 
   def __str__(self):
     return self.name
 
   def __hash__(self):
-    return hash(self.name)
+    return self._hash
 
   def __eq__(self, other):
-    return isinstance(other, Identifier) and self.name == other.name
+    return self is other or isinstance(other, Identifier) and self.name == other.name
 
 
+@dataclass(slots=True, frozen=True, eq=False, repr=False)
 class Lambda(ASTNode):
 
-  __match_args__ = ('file', 'line', 'col', 'param', 'body')
+  TAG = 1
 
-  def __init__(self, file: str, line: int, col: int, param: Identifier, body: Expression):
-    super().__init__(file, line, col)
-    self.param = param
-    self.body = body
+  param: Identifier
+  body: Expression
+  _hash: int = field(init=False)
 
   def __str__(self):
     return f"{self.param}.{self.body}"
 
+  def __hash__(self):
+    return _alpha_hash(self)
 
+  def __eq__(self, other):
+    return _alpha_eq(self, other)
+
+
+@dataclass(slots=True, frozen=True, eq=False, repr=False)
 class Parentheses(ASTNode):
 
-  __match_args__ = ('file', 'line', 'col', 'expr')
+  TAG = 2
 
-  def __init__(self, file: str, line: int, col: int, expr: Expression):
-    super().__init__(file, line, col)
-    self.expr = expr
+  expr: Expression
+  _hash: int = field(init=False)
 
   def __str__(self):
     return f"({self.expr})"
 
+  def __hash__(self):
+    return _alpha_hash(self)
 
+  def __eq__(self, other):
+    return _alpha_eq(self, other)
+
+
+@dataclass(slots=True, frozen=True, eq=False, repr=False)
 class Apply(ASTNode):
 
-  __match_args__ = ('file', 'line', 'col', 'func', 'applicant')
+  TAG = 3
 
-  def __init__(self, file: str, line: int, col: int, func: Expression, applicant: Expression):
-    super().__init__(file, line, col)
-    self.func = func
-    self.applicant = applicant
+  func: Expression
+  applicant: Expression
+  _hash: int = field(init=False)
 
   def __str__(self):
     if isinstance(self.func, (Lambda)):
       return f"({self.func}) {self.applicant}"
     return f"{self.func} {self.applicant}"
 
+  def __hash__(self):
+    return _alpha_hash(self)
+
+  def __eq__(self, other):
+    return _alpha_eq(self, other)
 
+
+@dataclass(slots=True, frozen=True, eq=False, repr=False)
 class Binding(ASTNode):
 
-  __match_args__ = ('file', 'line', 'col', 'name', 'expr')
+  TAG = 4
 
-  def __init__(self, file: str, line: int, col: int, name: Identifier, expr: Expression):
-    super().__init__(file, line, col)
-    self.name = name
-    self.expr = expr
+  name: Identifier
+  expr: Expression
 
   def __str__(self):
     return f"let {self.name} = {self.expr}"
 
 
+@dataclass(slots=True, frozen=True, eq=False, repr=False)
 class Program(ASTNode):
 
-  __match_args__ = ('file', 'line', 'col', 'bindings', 'expr')
+  TAG = 5
 
-  def __init__(self, file: str, line: int, col: int, bindings: list[Binding], expr: Expression):
-    super().__init__(file, line, col)
-    self.bindings = bindings
-    self.expr = expr
+  bindings: list[Binding]
+  expr: Expression
 
   def __str__(self):
     return f"{str(self.expr)}\nwhere\n{chr(0x0A).join(map(str, self.bindings))}"
 
 
+def free_vars(expr: Expression) -> set[str]:
+  names: set[str] = set()
+  bound: dict[str, int] = {}
+  stack: list[tuple[Expression, bool]] = [(expr, False)]
+
+  while stack:
+    node, visited = stack.pop()
+    tag = node.TAG
+
+    if tag == Identifier.TAG:
+      if not bound.get(node.name):  # type: ignore
+        names.add(node.name)  # type: ignore
+    elif tag == Lambda.TAG:
+      name = node.param.name  # type: ignore
+      if visited:
+        bound[name] -= 1
+      else:
+        bound[name] = bound.get(name, 0) + 1
+        stack.append((node, True))
+        stack.append((node.body, False))  # type: ignore
+    elif tag == Parentheses.TAG:
+      stack.append((node.expr, False))  # type: ignore
+    else:
+      stack.append((node.applicant, False))  # type: ignore
+      stack.append((node.func, False))  # type: ignore
+
+  return names
+
+
+_CLOSED = sys.maxsize
+
+
+def _alpha_hash(expr: 'Lambda | Parentheses | Apply') -> int:
+  try:
+    return expr._hash
+  except AttributeError:
+    pass
+
+  bound: dict[str, list[int]] = {}
+  depth = 0
+  results: list[tuple[int, int]] = []
+  stack: list[tuple[Expression, bool]] = [(expr, False)]
+
+  while stack:
+    node, visited = stack.pop()
+    tag = node.TAG
+
+    if tag == Identifier.TAG:
+      levels = bound.get(node.name)  # type: ignore
+      if levels:
+        results.append((depth - 1 - levels[-1], levels[-1]))
+      else:
+        results.append((node._hash, -1))
+      continue
+
+    if not visited:
+      try:
+        results.append((node._hash, _CLOSED))
+        continue
+      except AttributeError:
+        pass
+
+      stack.append((node, True))
+      if tag == Lambda.TAG:
+        bound.setdefault(node.param.name, []).append(depth)  # type: ignore
+        depth += 1
+        stack.append((node.body, False))  # type: ignore
+      elif tag == Parentheses.TAG:
+        stack.append((node.expr, False))  # type: ignore
+      else:
+        stack.append((node.applicant, False))  # type: ignore
+        stack.append((node.func, False))  # type: ignore
+      continue
+
+    if tag == Lambda.TAG:
+      depth -= 1
+      bound[node.param.name].pop()  # type: ignore
+      h, level = results.pop()
+      h = hash(('λ', h))
+    elif tag == Parentheses.TAG:
+      h, level = results.pop()
+      h = hash(('()', h))
+    else:
+      applicant, func = results.pop(), results.pop()
+      h = hash((func[0], applicant[0]))
+      level = func[1] if func[1] < applicant[1] else applicant[1]
+
+    if level >= depth:
+      object.__setattr__(node, '_hash', h)
+    results.append((h, level))
+
+  return results[0][0]
+
+
+def _alpha_eq(expr: 'Lambda | Parentheses | Apply', other: object) -> bool:
+  if expr is other:
+    return True
+  if type(expr) is not type(other) or hash(expr) != hash(other):
+    return False
+
+  left: dict[str, list[int]] = {}
+  right: dict[str, list[int]] = {}
+  depth = 0
+  stack: list[tuple[Expression, Expression, bool]] = [(expr, other, False)]  # type: ignore
+
+  while stack:
+    a, b, visited = stack.pop()
+
+    if visited:
+      depth -= 1
+      left[a.param.name].pop()  # type: ignore
+      right[b.param.name].pop()  # type: ignore
+      continue
+
+    tag = a.TAG
+    if tag != b.TAG:
+      return False
+
+    if tag == Identifier.TAG:
+      l, r = left.get(a.name), right.get(b.name)  # type: ignore
+      if l or r:
+        if not (l and r and l[-1] == r[-1]):
+          return False
+      elif a.name != b.name:  # type: ignore
+        return False
+    elif a is b and hasattr(a, '_hash'):
+      continue
+    elif tag == Lambda.TAG:
+      left.setdefault(a.param.name, []).append(depth)  # type: ignore
+      right.setdefault(b.param.name, []).append(depth)  # type: ignore
+      depth += 1
+      stack.append((a, b, True))
+      stack.append((a.body, b.body, False))  # type: ignore
+    elif tag == Parentheses.TAG:
+      stack.append((a.expr, b.expr, False))  # type: ignore
+    else:
+      stack.append((a.applicant, b.applicant, False))  # type: ignore
+      stack.append((a.func, b.func, False))  # type: ignore
+
+  return True
+
+
+_INDENTS: list[str] = ['']
+
+
+def _location(ast: ASTNode) -> str:
+  line, col = ast.line_col()
+  return f"{ast.file}:{line}:{col}"
+
+
+def _dump_identifier(ast: Identifier, depth: int, stack: list[tuple[ASTNode, int]]) -> str:
+  return f"Identifier {ast.name} ({_location(ast)})"
+
+
+def _dump_lambda(ast: Lambda, depth: int, stack: list[tuple[ASTNode, int]]) -> str:
+  stack.append((ast.body, depth + 1))
+  stack.append((ast.param, depth + 1))
+  return f"Lambda ({_location(ast)})"
+
+
+def _dump_parentheses(ast: Parentheses, depth: int, stack: list[tuple[ASTNode, int]]) -> str:
+  stack.append((ast.expr, depth + 1))
+  return f"Parentheses ({_location(ast)})"
+
+
+def _dump_apply(ast: Apply, depth: int, stack: list[tuple[ASTNode, int]]) -> str:
+  stack.append((ast.applicant, depth + 1))
+  stack.append((ast.func, depth + 1))
+  return f"Apply ({_location(ast)})"
+
+
+def _dump_binding(ast: Binding, depth: int, stack: list[tuple[ASTNode, int]]) -> str:
+  stack.append((ast.expr, depth + 1))
+  stack.append((ast.name, depth + 1))
+  return f"Binding ({_location(ast)})"
+
+
+def _dump_program(ast: Program, depth: int, stack: list[tuple[ASTNode, int]]) -> str:
+  stack.append((ast.expr, depth + 1))
+  for binding in reversed(ast.bindings):
+    stack.append((binding, depth + 1))
+  return f"Program ({_location(ast)})"
+
+
+_DUMP = (
+  _dump_identifier, _dump_lambda, _dump_parentheses, _dump_apply, _dump_binding, _dump_program
+)
+
+
 def dump_ast(ast: ASTNode, *, depth = 0):
-  match ast:
-    case Identifier(f, l, c, name):
-      print(f"{'  ' * depth}Identifier {name} ({f}:{l}:{c})")
-    case Lambda(f, l, c, param, body):
-      print(f"{'  ' * depth}Lambda ({f}:{l}:{c})")
-      dump_ast(param, depth=depth+1)
-      dump_ast(body, depth=depth+1)
-    case Parentheses(f, l, c, expr):
-      print(f"{'  ' * depth}Parentheses ({f}:{l}:{c})")
-      dump_ast(expr, depth=depth+1)
-    case Apply(f, l, c, func, applicant):
-      print(f"{'  ' * depth}Apply ({f}:{l}:{c})")
-      dump_ast(func, depth=depth+1)
-      dump_ast(applicant, depth=depth+1)
-    case Binding(f, l, c, name, expr):
-      print(f"{'  ' * depth}Binding ({f}:{l}:{c})")
-      dump_ast(name, depth=depth+1)
-      dump_ast(expr, depth=depth+1)
-    case Program(f, l, c, bindings, expr):
-      print(f"{'  ' * depth}Program ({f}:{l}:{c})")
-      for binding in bindings:
-        dump_ast(binding, depth=depth+1)
-      dump_ast(expr, depth=depth+1)
+  parts: list[str] = []
+  stack: list[tuple[ASTNode, int]] = [(ast, depth)]
+
+  while stack:
+    node, depth = stack.pop()
+    while len(_INDENTS) <= depth:
+      _INDENTS.append(_INDENTS[-1] + '  ')
+    parts.append(_INDENTS[depth])
+    parts.append(_DUMP[node.TAG](node, depth, stack))
+    parts.append('\n')
+
+  sys.stdout.write(''.join(parts))
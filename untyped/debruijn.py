@@ -0,0 +1,250 @@
+from typing import Any, Callable, ClassVar, TypeAlias
+
+from untyped.ast import Apply, Expression, Identifier, Lambda, Parentheses
+
+DBExpr: TypeAlias = 'DBVar | DBFree | DBLam | DBApp'
+Env: TypeAlias = 'tuple[Any, Env] | None'
+
+
+class DBVar:
+
+  __slots__ = ('index', 'scope', 'origin')
+  TAG: ClassVar[int] = 0
+  __match_args__ = ('index',)
+
+  def __init__(self, index: int, origin: Identifier):
+    self.index = index
+    self.scope = index + 1
+    self.origin = origin
+
+  def __str__(self):
+    return str(self.index)
+
+  def __repr__(self):
+    return f"DBVar({self.index})"
+
+
+class DBFree:
+
+  __slots__ = ('ident', 'scope')
+  TAG: ClassVar[int] = 1
+  __match_args__ = ('ident',)
+
+  def __init__(self, ident: Identifier):
+    self.ident = ident
+    self.scope = 0
+
+  def __str__(self):
+    return self.ident.name
+
+  def __repr__(self):
+    return f"DBFree({self.ident.name})"
+
+
+class DBLam:
+
+  __slots__ = ('param', 'body', 'scope', 'origin', 'source')
+  TAG: ClassVar[int] = 2
+  __match_args__ = ('param', 'body')
+
+  def __init__(
+    self, param: Identifier, body: DBExpr, origin: Lambda, source: Lambda | None = None
+  ):
+    self.param = param
+    self.body = body
+    self.scope = body.scope - 1 if body.scope else 0
+    self.origin = origin
+    self.source = source
+
+  def __str__(self):
+    return f"λ.{self.body}"
+
+  def __repr__(self):
+    return f"DBLam({self.body!r})"
+
+
+class DBApp:
+
+  __slots__ = ('func', 'applicant', 'scope', 'origin', 'source')
+  TAG: ClassVar[int] = 3
+  __match_args__ = ('func', 'applicant')
+
+  def __init__(
+    self, func: DBExpr, applicant: DBExpr, origin: Apply, source: Apply | None = None
+  ):
+    self.func = func
+    self.applicant = applicant
+    self.scope = func.scope if func.scope > applicant.scope else applicant.scope
+    self.origin = origin
+    self.source = source
+
+  def __str__(self):
+    return f"({self.func} {self.applicant})"
+
+  def __repr__(self):
+    return f"DBApp({self.func!r}, {self.applicant!r})"
+
+
+def _to_debruijn_identifier(expr: Identifier, bound: list[Identifier]) -> DBExpr:
+  for i in range(len(bound) - 1, -1, -1):
+    if bound[i] == expr:
+      return DBVar(len(bound) - 1 - i, expr)
+  return DBFree(expr)
+
+
+def _to_debruijn_lambda(expr: Lambda, bound: list[Identifier]) -> DBExpr:
+  body = expr.body
+  bound.append(expr.param)
+  term = DBLam(expr.param, _TO_DEBRUIJN[body.TAG](body, bound), expr, expr)
+  bound.pop()
+  return term
+
+
+def _to_debruijn_parentheses(expr: Parentheses, bound: list[Identifier]) -> DBExpr:
+  e = expr.expr
+  return _TO_DEBRUIJN[e.TAG](e, bound)
+
+
+def _to_debruijn_apply(expr: Apply, bound: list[Identifier]) -> DBExpr:
+  func, applicant = expr.func, expr.applicant
+  return DBApp(
+    _TO_DEBRUIJN[func.TAG](func, bound), _TO_DEBRUIJN[applicant.TAG](applicant, bound), expr, expr
+  )
+
+
+_TO_DEBRUIJN = (
+  _to_debruijn_identifier, _to_debruijn_lambda, _to_debruijn_parentheses, _to_debruijn_apply
+)
+
+
+def to_debruijn(expr: Expression, bound: list[Identifier] | None = None) -> DBExpr:
+  return _TO_DEBRUIJN[expr.TAG](expr, bound if bound is not None else [])  # type: ignore
+
+
+def _outer_refs_var(term: DBVar, depth: int, indices: set[int], names: set[str]):
+  if term.index >= depth:
+    indices.add(term.index - depth)
+
+
+def _outer_refs_free(term: DBFree, depth: int, indices: set[int], names: set[str]):
+  names.add(term.ident.name)
+
+
+def _outer_refs_lam(term: DBLam, depth: int, indices: set[int], names: set[str]):
+  body = term.body
+  _OUTER_REFS[body.TAG](body, depth + 1, indices, names)
+
+
+def _outer_refs_app(term: DBApp, depth: int, indices: set[int], names: set[str]):
+  func, applicant = term.func, term.applicant
+  _OUTER_REFS[func.TAG](func, depth, indices, names)
+  _OUTER_REFS[applicant.TAG](applicant, depth, indices, names)
+
+
+_OUTER_REFS = (_outer_refs_var, _outer_refs_free, _outer_refs_lam, _outer_refs_app)
+
+
+def _group(expr: Expression) -> Expression:
+  if isinstance(expr, (Apply, Lambda)):
+    return Parentheses(expr.source, expr.offset, expr)
+  return expr
+
+
+def _from_debruijn_var(term: DBVar, names: list[Identifier]) -> Expression:
+  name, origin = names[len(names) - 1 - term.index], term.origin
+  if name.name == origin.name:
+    return origin
+  return Identifier(origin.source, origin.offset, name.name)
+
+
+def _from_debruijn_free(term: DBFree, names: list[Identifier]) -> Expression:
+  return term.ident
+
+
+def _from_debruijn_lam(term: DBLam, names: list[Identifier]) -> Expression:
+  if term.source is not None and not term.scope:
+    return term.source
+
+  param, body = term.param, term.body
+  indices: set[int] = set()
+  taken: set[str] = set()
+  _OUTER_REFS[body.TAG](body, 1, indices, taken)
+  taken.update(names[len(names) - 1 - i].name for i in indices)
+
+  if param.name in taken:
+    n = 1
+    while f"{param.name}{n}" in taken:
+      n += 1
+    param = Identifier(param.source, param.offset, f"{param.name}{n}")
+
+  names.append(param)
+  new_body = _FROM_DEBRUIJN[body.TAG](body, names)
+  names.pop()
+  origin = term.origin
+  return Lambda(origin.source, origin.offset, param, new_body)
+
+
+def _from_debruijn_app(term: DBApp, names: list[Identifier]) -> Expression:
+  if term.source is not None and not term.scope:
+    return term.source
+
+  func = _FROM_DEBRUIJN[term.func.TAG](term.func, names)
+  applicant = _FROM_DEBRUIJN[term.applicant.TAG](term.applicant, names)
+  grouped = func
+  if isinstance(func, Lambda):
+    grouped = Parentheses(func.source, func.offset, func)
+  origin = term.origin
+  return Apply(origin.source, origin.offset, grouped, _group(applicant))
+
+
+_FROM_DEBRUIJN = (
+  _from_debruijn_var, _from_debruijn_free, _from_debruijn_lam, _from_debruijn_app
+)
+
+
+def from_debruijn(term: DBExpr, names: list[Identifier] | None = None) -> Expression:
+  return _FROM_DEBRUIJN[term.TAG](term, names if names is not None else [])  # type: ignore
+
+
+def lookup(env: Env, index: int) -> Any:
+  for _ in range(index):
+    env = env[1]  # type: ignore
+  return env[0]  # type: ignore
+
+
+def _read_back_var(term: DBVar, env: Env, depth: int, quote: Callable[[Any], DBExpr]) -> DBExpr:
+  if term.index < depth:
+    return term
+  return quote(lookup(env, term.index - depth))
+
+
+def _read_back_free(term: DBFree, env: Env, depth: int, quote: Callable[[Any], DBExpr]) -> DBExpr:
+  return term
+
+
+def _read_back_lam(term: DBLam, env: Env, depth: int, quote: Callable[[Any], DBExpr]) -> DBExpr:
+  if term.scope <= depth:
+    return term
+  body = term.body
+  return DBLam(term.param, _READ_BACK[body.TAG](body, env, depth + 1, quote), term.origin)
+
+
+def _read_back_app(term: DBApp, env: Env, depth: int, quote: Callable[[Any], DBExpr]) -> DBExpr:
+  if term.scope <= depth:
+    return term
+  func, applicant = term.func, term.applicant
+  return DBApp(
+    _READ_BACK[func.TAG](func, env, depth, quote),
+    _READ_BACK[applicant.TAG](applicant, env, depth, quote),
+    term.origin,
+  )
+
+
+_READ_BACK = (_read_back_var, _read_back_free, _read_back_lam, _read_back_app)
+
+
+def read_back(func: DBLam, env: Env, quote: Callable[[Any], DBExpr]) -> DBLam:
+  if not func.scope:
+    return func
+  body = func.body
+  return DBLam(func.param, _READ_BACK[body.TAG](body, env, 1, quote), func.origin)
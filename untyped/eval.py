@@ -1,87 +1,136 @@
-from typing import TypeVar
-from untyped.ast import Apply, Expression, Identifier, Lambda, Parentheses
-
-T = TypeVar('T', bound=Expression)
-
-def alpha_convert(expr: T, old: Identifier, new: Identifier) -> T:
-  match expr:
-    case Identifier(_, _, _, _) as ident:
-      return new if ident == old else ident  # type: ignore
-    case Lambda(_, _, _, param, body):
-      if param == old:
-        return expr
-      return Lambda(expr.file, expr.line, expr.col, param, alpha_convert(body, old, new))  # type: ignore
-    case Parentheses(_, _, _, e):
-      return Parentheses(e.file, e.line, e.col, alpha_convert(e, old, new))  # type: ignore
-    case Apply(_, _, _, func, applicant):
-      return Apply(expr.file, expr.line, expr.col, alpha_convert(func, old, new), alpha_convert(applicant, old, new))  # type: ignore
-
-
-def unique_ident(expr: T, known: dict[Identifier, int] | None = None) -> T:
-  known = known or {}
-
-  match expr:
-    case Lambda(_, _, _, param, body):
-      if param in known:
-        known[param] += 1
-        new = Identifier(param.file, param.line, param.col, f"{param.name}${known[param]}")
-
-        return Lambda(expr.file, expr.line, expr.col, new, alpha_convert(body, param, new))  # type: ignore
-      known[param] = 0
-    case Parentheses(_, _, _, e):
-      return Parentheses(e.file, e.line, e.col, unique_ident(e, known.copy()))  # type: ignore
-    case Apply(_, _, _, func, applicant):
-      return Apply(expr.file, expr.line, expr.col, unique_ident(func, known.copy()), unique_ident(applicant, known.copy()))  # type: ignore
-  return expr
-
-
-def ununique_ident(expr: T) -> T:
-  def _walk(expr: T) -> T:
-    match expr:
-      case Identifier(_, _, _, name):
-        return Identifier(expr.file, expr.line, expr.col, name.split('$')[0]) # type: ignore
-      case Lambda(_, _, _, param, body):
-        return Lambda(expr.file, expr.line, expr.col, _walk(param), _walk(body)) # type: ignore
-      case Parentheses(_, _, _, e):
-        return Parentheses(e.file, e.line, e.col, _walk(e)) # type: ignore
-      case Apply(_, _, _, func, applicant):
-        return Apply(expr.file, expr.line, expr.col, _walk(func), _walk(applicant)) # type: ignore
-
-  return _walk(expr)
-
-
-def apply(func: Lambda, applicant: Expression) -> Expression:
-  func = unique_ident(func)
-  param = func.param
-
-  def _walk(expr: Expression) -> Expression:
-    match expr:
-      case Identifier(_, _, _, _) as ident:
-        return applicant if ident == param else ident
-      case Lambda(_, _, _, _, _):
-        if param == expr.param:
-          return expr
-        return Lambda(expr.file, expr.line, expr.col, expr.param, _walk(expr.body))
-      case Parentheses(_, _, _, e):
-        return Parentheses(e.file, e.line, e.col, _walk(e))
-      case Apply(_, _, _, f, a):
-        return Apply(expr.file, expr.line, expr.col, _walk(f), _walk(a))
-
-  return ununique_ident(_walk(func.body))
-
-
-def eval(expr: Expression) -> Expression:
-  match expr:
-    case Identifier(_, _, _, _):
-      return expr
-    case Lambda(_, _, _, _, _):
-      return expr
-    case Parentheses(_, _, _, e):
-      return eval(e)
-    case Apply(_, _, _, func, applicant):
-      func = eval(func)
-      applicant = eval(applicant)
-
-      if isinstance(func, Lambda):
-        return eval(apply(func, applicant))
-      return Apply(expr.file, expr.line, expr.col, func, applicant)
+from typing import Any, Callable, TypeAlias
+from weakref import WeakKeyDictionary, ref
+
+from untyped import vm
+from untyped.ast import Apply, Expression, Identifier, Lambda, free_vars
+from untyped.debruijn import (
+  DBApp, DBExpr, DBFree, DBLam, DBVar, from_debruijn, lookup, read_back, to_debruijn
+)
+from untyped.parse import as_py_func
+
+try:
+  from untyped._eval_core import run as _run
+except ImportError:
+  _run = vm.run
+
+Value: TypeAlias = 'Closure | Stuck | DBFree'
+Env: TypeAlias = 'tuple[Value, Env] | None'
+
+_ARG = 0
+_CALL = 1
+
+_memo: 'dict[int, tuple[ref[Expression], Expression]]' = {}
+_py_funcs: 'WeakKeyDictionary[Expression, Callable[[Any], Any]]' = WeakKeyDictionary()
+
+
+class Closure:
+
+  __match_args__ = ('func', 'env')
+
+  def __init__(self, func: DBLam, env: Env):
+    self.func = func
+    self.env = env
+    self._quoted: DBLam | None = None
+
+  def __str__(self):
+    return str(from_debruijn(quote(self)))
+
+  def __repr__(self):
+    return str(self)
+
+
+class Stuck:
+
+  __match_args__ = ('func', 'applicant')
+
+  def __init__(self, func: 'Stuck | DBFree', applicant: Value, origin: Apply):
+    self.func = func
+    self.applicant = applicant
+    self.origin = origin
+
+  def __str__(self):
+    return str(from_debruijn(quote(self)))
+
+  def __repr__(self):
+    return str(self)
+
+
+def quote(value: Value) -> DBExpr:
+  if isinstance(value, Closure):
+    if value._quoted is None:
+      value._quoted = read_back(value.func, value.env, quote)
+    return value._quoted
+  if isinstance(value, Stuck):
+    return DBApp(quote(value.func), quote(value.applicant), value.origin)
+  return value
+
+
+def _eval(term: DBExpr, env: Env) -> Value:
+  stack: list[tuple] = []
+
+  while True:
+    tag = term.TAG
+
+    if tag == DBApp.TAG:
+      stack.append((_ARG, term.applicant, env, term.origin))  # type: ignore
+      term = term.func  # type: ignore
+      continue
+
+    if tag == DBVar.TAG:
+      value = lookup(env, term.index)  # type: ignore
+    elif tag == DBLam.TAG:
+      value = Closure(term, env)  # type: ignore
+    else:
+      value = term
+
+    while stack:
+      frame = stack.pop()
+
+      if frame[0] == _ARG:
+        stack.append((_CALL, value, frame[3]))
+        term, env = frame[1], frame[2]
+        break
+
+      func = frame[1]
+      if isinstance(func, Closure):
+        term, env = func.func.body, (value, func.env)
+        break
+      value = Stuck(func, value, frame[2])
+    else:
+      return value
+
+
+def eval(expr: Expression, *, tree: bool = False) -> Expression:
+  if tree:
+    return from_debruijn(quote(_eval(to_debruijn(expr), None)))
+
+  if isinstance(expr, (Identifier, Lambda)):
+    return expr
+
+  key = id(expr)
+  entry = _memo.get(key)
+  if entry is not None and entry[0]() is expr:
+    return entry[1]
+
+  def forget(node: 'ref[Expression]'):
+    if _memo.get(key, (None,))[0] is node:
+      del _memo[key]
+
+  result = from_debruijn(_run(vm.compile_chunk(to_debruijn(expr))))
+  _memo[key] = (ref(expr, forget), result)
+  return result
+
+
+def eval_via_py(expr: Expression, *args: Any) -> Any:
+  names = free_vars(expr)
+  if names:
+    raise ValueError(f"Cannot compile {expr} with free variables {', '.join(sorted(names))}")
+
+  try:
+    func = _py_funcs[expr]
+  except KeyError:
+    func = _py_funcs[expr] = as_py_func(expr)
+
+  for arg in args:
+    func = func(arg)
+  return func
@@ -1,9 +1,18 @@
+import builtins
+import re
 from enum import Enum, auto
+from functools import lru_cache
+from types import CodeType
 from typing import Any, Callable
 
-from untyped.ast import ASTNode, Apply, Binding, Expression, Identifier, Lambda, Parentheses, Program
+from untyped.ast import (
+  ASTNode, Apply, Binding, Expression, Identifier, Lambda, Parentheses, Program, Source
+)
 from untyped.exc import UntypedError
-from untyped.util.either import Either, Err, Ok
+
+
+class _ParseError(UntypedError):
+  pass
 
 
 class TokenType(Enum):
@@ -16,24 +25,34 @@ class TokenType(Enum):
   LET = auto()
   WHERE = auto()
 
-  def expect(self, tokens: 'list[Token]', pos: int) -> Either['Token', UntypedError]:
-    if not tokens[pos:]:
-      return Err(UntypedError(f"Expected {self.name} but got EOF", tokens[pos-1].file, tokens[pos-1].line, tokens[pos-1].col))
-    
-    if tokens[pos].type != self:
-      return Err(UntypedError(f"Expected {self.name} but got {tokens[pos].type.name}", tokens[pos].file, tokens[pos].line, tokens[pos].col))
+  def expect(self, tokens: 'list[Token]', pos: int) -> 'Token':
+    if pos >= len(tokens):
+      last = tokens[pos - 1]
+      raise _ParseError(f"Expected {self.name} but got EOF", last.file, *last.line_col())
+
+    token = tokens[pos]
+    if token.type is not self:
+      raise _ParseError(
+        f"Expected {self.name} but got {token.type.name}", token.file, *token.line_col()
+      )
 
-    return Ok(tokens[pos])
+    return token
 
 
 class Token:
 
-  def __init__(self, type: TokenType, value: str, file: str, line: int, col: int):
+  def __init__(self, type: TokenType, value: str, source: Source, offset: int):
     self.type = type
     self.value = value
-    self.file = file
-    self.line = line
-    self.col = col
+    self.source = source
+    self.offset = offset
+
+  @property
+  def file(self) -> str:
+    return self.source.name
+
+  def line_col(self) -> tuple[int, int]:
+    return self.source.line_col(self.offset)
 
   def __str__(self):
     return self.value
@@ -42,205 +61,169 @@ class Token:
     return str(self)
 
 
+_TOKEN_RE = re.compile(
+  r"(?P<WS>[ \t\n]+)|(?P<LET>\blet\b)|(?P<WHERE>\bwhere\b)"
+  r"|(?P<IDENTIFIER>[A-Za-z_][A-Za-z_0-9]*)"
+  r"|(?P<DOT>\.)|(?P<EQUAL>=)|(?P<L_PAREN>\()|(?P<R_PAREN>\))|(?P<ERROR>.)"
+)
+
+
 def tokenize(file: str, code: str) -> list[Token]:
   tokens: list[Token] = []
-  line, col, cons = 1, 0, 0
+  source = Source.of(file, code)
 
-  for c in code:
-    cons += 1
-    col += 1
+  for m in _TOKEN_RE.finditer(code):
+    kind = m.lastgroup
 
-    if c == '\n':
-      line += 1
-      col = 0
+    if kind == 'WS':
       continue
 
-    if c == ' ':
-      continue
+    if kind == 'ERROR':
+      line, col = source.line_col(m.start())
+      raise ValueError(f"Unexpected character '{m.group()}' at {file}:{line}:{col}")
 
-    if c == '.':
-      tokens.append(Token(TokenType.DOT, c, file, line, col))
-      continue
+    tokens.append(Token(TokenType[kind], m.group(), source, m.start()))  # type: ignore
 
-    if c == '=':
-      tokens.append(Token(TokenType.EQUAL, c, file, line, col))
-      continue
+  return tokens
+
+
+_LAMBDA = 0
+_PAREN = 1
+
+
+def _is_lambda(tokens: list[Token], pos: int) -> bool:
+  return (
+    pos + 1 < len(tokens) and tokens[pos].type is TokenType.IDENTIFIER and
+    tokens[pos + 1].type is TokenType.DOT
+  )
+
+
+def _push(
+  tokens: list[Token], start: int, func: 'Expression | None', expr: Expression
+) -> Expression:
+  if func is None:
+    return expr
+  return Apply(tokens[start].source, tokens[start].offset, func, expr)
 
-    if c == '(':
-      tokens.append(Token(TokenType.L_PAREN, c, file, line, col))
-      continue
 
-    if c == ')':
-      tokens.append(Token(TokenType.R_PAREN, c, file, line, col))
+def parse_apply(tokens: list[Token], pos: int) -> tuple[Expression, int]:
+  frames: list[tuple[int, Expression | None, int, list[Token]]] = []
+  func: Expression | None = None
+  start = next = pos
+
+  while True:
+    if _is_lambda(tokens, next):
+      params = [tokens[next]]
+      next += 2
+      while _is_lambda(tokens, next):
+        params.append(tokens[next])
+        next += 2
+      frames.append((_LAMBDA, func, start, params))
+      func, start = None, next
       continue
 
-    if c == 'l' and code[cons:cons + 2] == 'et':
-      tokens.append(Token(TokenType.LET, 'let', file, line, col))
-      cons += 2
-      col += 2
+    if next < len(tokens) and tokens[next].type is TokenType.L_PAREN:
+      frames.append((_PAREN, func, start, [tokens[next]]))
+      func, start = None, next + 1
+      next += 1
       continue
 
-    if c == 'w' and code[cons:cons + 4] == 'here':
-      tokens.append(Token(TokenType.WHERE, 'where', file, line, col))
-      cons += 4
-      col += 4
+    if func is None or next < len(tokens) and tokens[next].type is TokenType.IDENTIFIER:
+      token = TokenType.IDENTIFIER.expect(tokens, next)
+      func = _push(tokens, start, func, Identifier(token.source, token.offset, token.value))
+      next += 1
       continue
 
-    if c in 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ_':
-      start = cons - 1
-      sc = col
+    while frames:
+      kind, outer, start, opening = frames.pop()
 
-      while col < len(code) and code[col] in 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_':
-        col += 1
-        cons += 1
+      if kind == _LAMBDA:
+        for token in reversed(opening):
+          param = Identifier(token.source, token.offset, token.value)
+          func = Lambda(token.source, token.offset, param, func)
+        func = _push(tokens, start, outer, func)
+        continue
 
-      tokens.append(Token(TokenType.IDENTIFIER, code[start:cons], file, line, sc))
-      continue
+      TokenType.R_PAREN.expect(tokens, next)
+      func = _push(tokens, start, outer, Parentheses(opening[0].source, opening[0].offset, func))
+      next += 1
+      break
+    else:
+      return func, next
 
-    raise ValueError(f"Unexpected character '{c}' at {file}:{line}:{col}")
 
-  return tokens
+def parse_expr(tokens: list[Token], pos: int) -> tuple[Expression, int]:
+  return parse_apply(tokens, pos)
 
 
-def parse_lambda(tokens: list[Token], pos: int) -> Either[tuple[Expression, int], UntypedError]:
-  match TokenType.IDENTIFIER.expect(tokens, pos):
-    case Err(_) as e:
-      return e
-    case Ok(token):
-      param = Identifier(token.file, token.line, token.col, token.value)
+def parse_binding(tokens: list[Token], pos: int) -> tuple[Binding, int]:
+  TokenType.LET.expect(tokens, pos)
+  token = TokenType.IDENTIFIER.expect(tokens, pos + 1)
+  name = Identifier(token.source, token.offset, token.value)
+  TokenType.EQUAL.expect(tokens, pos + 2)
+  expr, next = parse_expr(tokens, pos + 3)
+  return Binding(tokens[pos].source, tokens[pos].offset, name, expr), next
 
-  match TokenType.DOT.expect(tokens, pos + 1):
-    case Err(_) as e:
-      return e
 
-  match parse_expr(tokens, pos + 2):
-    case Err(_) as e:
-      return e
-    case Ok((expr, next)):
-      return Ok((Lambda(tokens[pos].file, tokens[pos].line, tokens[pos].col, param, expr), next))
+def parse(expr: str, file: str = '<stdin>') -> Expression:
+  tokens = tokenize(file, expr)
 
+  try:
+    exp, next = parse_expr(tokens, 0)
+  except _ParseError as e:
+    raise SyntaxError(f"{e.message} at line {e.line} column {e.col} in {e.file}") from None
 
-def parse_parentheses(tokens: list[Token], pos: int) -> Either[tuple[Expression, int], UntypedError]:
-  match TokenType.L_PAREN.expect(tokens, pos):
-    case Err(_) as e:
-      return e
+  if next != len(tokens):
+    token = tokens[next]
+    line, col = token.line_col()
+    raise SyntaxError(
+      f"Expected EOF but got {token.type.name} at line {line} column {col} in {token.file}"
+    )
+  return exp
 
-  match parse_expr(tokens, pos + 1):
-    case Err(_) as e:
-      return e
-    case Ok((expr, next)):
-      pass
 
-  match TokenType.R_PAREN.expect(tokens, next):
-    case Err(_) as e:
-      return e
-    case Ok(_):
-      return Ok((Parentheses(tokens[pos].file, tokens[pos].line, tokens[pos].col, expr), next + 1))
+def _py_expr_identifier(expr: Identifier) -> str:
+  return expr.name
 
 
-def parse_apply(tokens: list[Token], pos: int) -> Either[tuple[Expression, int], UntypedError]:
-  match parse_primal_expr(tokens, pos):
-    case Err(_) as e:
-      return e
-    case Ok((func, next)):
-      pass
+def _py_expr_lambda(expr: Lambda) -> str:
+  return f"lambda {expr.param.name}: {_PY_EXPR[expr.body.TAG](expr.body)}"
 
-  f = True
 
-  while True:
-    match parse_primal_expr(tokens, next):
-      case Err(_) as e:
-        if f:
-          return e
-        return Ok((func, next))
-      case Ok((applicant, next)):
-        func = Apply(tokens[pos].file, tokens[pos].line, tokens[pos].col, func, applicant)
-    f = False
-
-
-def parse_primal_expr(tokens: list[Token], pos: int) -> Either[tuple[Expression, int], UntypedError]:
-  match parse_lambda(tokens, pos):
-    case Ok((expr, next)):
-      return Ok((expr, next))
-    case Err(_) as e:
-      pass
-
-  match parse_parentheses(tokens, pos):
-    case Ok((expr, next)):
-      return Ok((expr, next))
-    case Err(_) as e:
-      pass
-
-  match TokenType.IDENTIFIER.expect(tokens, pos):
-    case Err(_) as e:
-      return e
-    case Ok(token):
-      return Ok((Identifier(token.file, token.line, token.col, token.value), pos + 1))
-
-
-def parse_expr(tokens: list[Token], pos: int) -> Either[tuple[Expression, int], UntypedError]:
-  match parse_apply(tokens, pos):
-    case Ok((expr, next)):
-      return Ok((expr, next))
-    case Err(_) as e:
-      pass
-
-  match parse_primal_expr(tokens, pos):
-    case Ok((expr, next)):
-      return Ok((expr, next))
-    case Err(_) as e:
-      return e
-
-
-def parse_binding(tokens: list[Token], pos: int) -> Either[tuple[Binding, int], UntypedError]:
-  match TokenType.LET.expect(tokens, pos):
-    case Err(_) as e:
-      return e
-
-  match TokenType.IDENTIFIER.expect(tokens, pos):
-    case Err(_) as e:
-      return e
-    case Ok(token):
-      name = Identifier(token.file, token.line, token.col, token.value)
-
-  match TokenType.EQUAL.expect(tokens, pos + 1):
-    case Err(_) as e:
-      return e
-
-  match parse_expr(tokens, pos + 2):
-    case Err(_) as e:
-      return e
-    case Ok((expr, next)):
-      return Ok((Binding(tokens[pos].file, tokens[pos].line, tokens[pos].col, name, expr), next))
+def _py_expr_parentheses(expr: Parentheses) -> str:
+  return f"({_PY_EXPR[expr.expr.TAG](expr.expr)})"
 
 
-def parse(expr: str, file: str = '<stdin>') -> Expression:
-  tokens = tokenize(file, expr)
-  res = parse_expr(tokens, 0)
+def _py_expr_apply(expr: Apply) -> str:
+  func, applicant = expr.func, expr.applicant
+  return f"{_PY_EXPR[func.TAG](func)}({_PY_EXPR[applicant.TAG](applicant)})"
 
-  match res:
-    case Err(e):
-      raise SyntaxError(f"{e.message} at line {e.line} column {e.col} in {e.file}")
-    case Ok((exp, next)):
-      if next != len(tokens):
-        raise SyntaxError(
-          f"Expected EOF but got {tokens[next].type.name} at line {tokens[next].line} column {tokens[next].col} in {tokens[next].file}"
-        )
-      return exp
+
+def _py_expr_invalid(expr: ASTNode) -> str:
+  raise ValueError(f"Invalid expression {expr}")
+
+
+_PY_EXPR = (
+  _py_expr_identifier,
+  _py_expr_lambda,
+  _py_expr_parentheses,
+  _py_expr_apply,
+  _py_expr_invalid,
+  _py_expr_invalid,
+)
 
 
 def as_py_expr(expr: Expression) -> str:
-  match expr:
-    case Identifier(_, _, _, name):
-      return name
-    case Lambda(_, _, _, param, body):
-      return f"lambda {as_py_expr(param)}: {as_py_expr(body)}"
-    case Parentheses(_, _, _, e):
-      return f"({as_py_expr(e)})"
-    case Apply(_, _, _, func, applicant):
-      return f"{as_py_expr(func)}({as_py_expr(applicant)})"
-    case _:
-      raise ValueError(f"Invalid expression {expr}")
+  return _PY_EXPR[expr.TAG](expr)  # type: ignore
+
+
+_eval = builtins.eval
+
+
+@lru_cache(maxsize=4096)
+def _py_code(source: str) -> CodeType:
+  return compile(source, '<untyped>', 'eval')
+
 
 def as_py_func(expr: Expression) -> Callable[[Any], Any]:
-  return __builtins__['eval'](as_py_expr(expr))
+  return _eval(_py_code(as_py_expr(expr)))
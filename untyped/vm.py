@@ -0,0 +1,126 @@
+from array import array
+from typing import TypeAlias
+
+from untyped.ast import Apply
+from untyped.debruijn import DBApp, DBExpr, DBFree, DBLam, DBVar, lookup, read_back
+
+OP_VAR = 0
+OP_FREE = 1
+OP_LAM = 2
+OP_APP = 3
+OP_RET = 4
+
+Value: TypeAlias = 'tuple[int, Env] | DBExpr'
+Env: TypeAlias = 'tuple[Value, Env] | None'
+
+
+class Chunk:
+
+  __slots__ = ('code', 'entries', 'lambdas', 'frees', 'applies')
+
+  def __init__(
+    self,
+    code: array,
+    entries: list[int],
+    lambdas: list[DBLam],
+    frees: list[DBFree],
+    applies: list[Apply],
+  ):
+    self.code = code
+    self.entries = entries
+    self.lambdas = lambdas
+    self.frees = frees
+    self.applies = applies
+
+
+def compile_chunk(term: DBExpr) -> Chunk:
+  code = array('i')
+  entries: list[int] = []
+  lambdas: list[DBLam] = []
+  frees: list[DBFree] = []
+  applies: list[Apply] = []
+  pending: list[tuple[DBExpr, int]] = [(term, -1)]
+
+  while pending:
+    root, lam = pending.pop()
+    if lam >= 0:
+      entries[lam] = len(code)
+
+    stack: list[tuple[DBExpr, bool]] = [(root, False)]
+    while stack:
+      node, visited = stack.pop()
+
+      match node.TAG:
+        case DBVar.TAG:
+          code.extend((OP_VAR, node.index))  # type: ignore
+        case DBFree.TAG:
+          code.extend((OP_FREE, len(frees)))
+          frees.append(node)  # type: ignore
+        case DBLam.TAG:
+          code.extend((OP_LAM, len(lambdas)))
+          pending.append((node.body, len(lambdas)))  # type: ignore
+          lambdas.append(node)  # type: ignore
+          entries.append(0)
+        case DBApp.TAG if visited:
+          code.extend((OP_APP, len(applies)))
+          applies.append(node.origin)  # type: ignore
+        case DBApp.TAG:
+          stack.append((node, True))
+          stack.append((node.applicant, False))  # type: ignore
+          stack.append((node.func, False))  # type: ignore
+
+    code.extend((OP_RET, 0))
+
+  return Chunk(code, entries, lambdas, frees, applies)
+
+
+def _quote(chunk: Chunk, value: Value, cache: dict) -> DBExpr:
+  if type(value) is not tuple:
+    return value  # type: ignore
+
+  quoted = cache.get(id(value))
+  if quoted is None:
+    quoted = read_back(
+      chunk.lambdas[value[0]], value[1], lambda arg: _quote(chunk, arg, cache)
+    )
+    cache[id(value)] = quoted
+  return quoted
+
+
+def run(chunk: Chunk) -> DBExpr:
+  code, entries, frees, applies = chunk.code, chunk.entries, chunk.frees, chunk.applies
+  stack: list[Value] = []
+  frames: list[tuple[int, Env]] = []
+  env: Env = None
+  pc = 0
+
+  while True:
+    op = code[pc]
+
+    if op == OP_APP:
+      applicant = stack.pop()
+      func = stack.pop()
+
+      if type(func) is tuple:
+        if code[pc + 2] != OP_RET:
+          frames.append((pc + 2, env))
+        pc, env = entries[func[0]], (applicant, func[1])  # type: ignore
+        continue
+
+      applicant = _quote(chunk, applicant, {})
+      stack.append(DBApp(func, applicant, applies[code[pc + 1]]))  # type: ignore
+    elif op == OP_VAR:
+      stack.append(lookup(env, code[pc + 1]))
+    elif op == OP_LAM:
+      stack.append((code[pc + 1], env))
+    elif op == OP_FREE:
+      stack.append(frees[code[pc + 1]])
+    elif op == OP_RET:
+      if not frames:
+        break
+      pc, env = frames.pop()
+      continue
+
+    pc += 2
+
+  return _quote(chunk, stack.pop(), {})